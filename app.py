@@ -9,13 +9,13 @@ import cv2
 import numpy as np
 from datetime import datetime
 import os
+import sys
 import base64
-import pickle
 from production_face_recognition import ProductionFaceRecognition
 from database_manager import DatabaseManager
-import pandas as pd
 import threading
-import time
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 
 app = Flask(__name__)
 CORS(app)
@@ -23,19 +23,37 @@ CORS(app)
 # Initialize systems
 face_system = ProductionFaceRecognition()
 face_system.load_database()
+face_system.warmup()
 db_manager = DatabaseManager()
+os.makedirs('exports', exist_ok=True)  # Created once here rather than on every export
 
 # Global state
 camera = None
 camera_lock = threading.Lock()
 is_camera_active = False
 marked_today = set()
+marked_date = None  # Day that marked_today belongs to
+latest_frame = None  # Newest camera frame, replaced by the reader thread
+frame_number = 0  # Incremented for every frame the reader thread stores
+frame_ready = threading.Condition()
+capture_thread = None
+io_pool = ThreadPoolExecutor(max_workers=2)  # Background disk writes
+
+# Native capture backend per platform - skips OpenCV probing every backend in turn
+if sys.platform.startswith('linux'):
+    CAMERA_BACKEND = cv2.CAP_V4L2
+elif sys.platform == 'darwin':
+    CAMERA_BACKEND = cv2.CAP_AVFOUNDATION
+elif sys.platform == 'win32':
+    CAMERA_BACKEND = cv2.CAP_DSHOW
+else:
+    CAMERA_BACKEND = cv2.CAP_ANY
 
 # Load today's attendance
 def load_today_attendance():
-    global marked_today
-    today = datetime.now().strftime('%Y-%m-%d')
-    records = db_manager.get_attendance_by_date(today)
+    global marked_today, marked_date
+    marked_date = datetime.now().strftime('%Y-%m-%d')
+    records = db_manager.get_attendance_by_date(marked_date)
     marked_today = set(record[0] for record in records)
 
 load_today_attendance()
@@ -45,10 +63,15 @@ def get_camera():
     global camera, is_camera_active
     with camera_lock:
         if camera is None or not camera.isOpened():
-            camera = cv2.VideoCapture(0)
+            camera = cv2.VideoCapture(0, CAMERA_BACKEND)
+            if not camera.isOpened() and CAMERA_BACKEND != cv2.CAP_ANY:
+                # This OpenCV build lacks the native backend - let it probe
+                camera = cv2.VideoCapture(0)
             camera.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
             camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
             camera.set(cv2.CAP_PROP_FPS, 30)
+            # Keep a single frame queued so read() hands back the newest frame
+            camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
             is_camera_active = True
     return camera
 
@@ -61,29 +84,89 @@ def release_camera():
             camera = None
             is_camera_active = False
 
-def generate_frames():
-    """Generate video frames for streaming"""
-    global marked_today
+FRAME_PART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+def capture_frames():
+    """Read camera frames on a background thread, keeping only the newest one"""
+    global latest_frame, frame_number
+    # Only read a camera that start_camera opened - never open the device from here
+    with camera_lock:
+        cam = camera
+    if cam is None:
+        return
 
     while is_camera_active:
-        cam = get_camera()
         success, frame = cam.read()
 
         if not success:
             break
 
+        # Overwrite the previous frame so the stream never processes an old one
+        with frame_ready:
+            latest_frame = frame
+            frame_number += 1
+            frame_ready.notify_all()
+
+def start_capture():
+    """Start the camera reader thread if it is not already running"""
+    global capture_thread, latest_frame
+    with camera_lock:
+        if capture_thread is not None and capture_thread.is_alive():
+            return
+
+        # Discard any frame left over from a previous session
+        with frame_ready:
+            latest_frame = None
+
+        capture_thread = threading.Thread(target=capture_frames, daemon=True)
+        capture_thread.start()
+
+def generate_frames():
+    """Generate video frames for streaming"""
+    global marked_today
+
+    # A stopped camera streams nothing, as before - requesting the feed doesn't turn it on
+    if not is_camera_active:
+        return
+
+    start_capture()
+    last_number = None
+
+    while is_camera_active:
+        # Wait for a frame this stream has not processed yet (paced by the camera)
+        with frame_ready:
+            frame_ready.wait_for(
+                lambda: latest_frame is not None and frame_number != last_number,
+                timeout=1.0
+            )
+            frame, number = latest_frame, frame_number
+
+        if frame is None or number == last_number:
+            if capture_thread is None or not capture_thread.is_alive():
+                break
+            continue
+        last_number = number
+
         # Recognize faces
         recognized_faces = face_system.recognize_faces(frame, return_all=False)
 
-        # Auto-mark attendance
-        for face in recognized_faces:
-            if face['student_id'] and face['student_id'] not in marked_today:
-                success = db_manager.mark_attendance(
-                    face['student_id'],
-                    face['name'],
-                    'P'
-                )
-                if success:
+        # Start over at midnight - otherwise the set keeps growing and yesterday's
+        # students are never marked again
+        if datetime.now().strftime('%Y-%m-%d') != marked_date:
+            load_today_attendance()
+
+        # Auto-mark attendance - every new face in the frame in a single DB round trip
+        new_faces = [
+            face for face in recognized_faces
+            if face['student_id'] and face['student_id'] not in marked_today
+        ]
+        if new_faces:
+            marked = db_manager.mark_attendance_many(
+                [(face['student_id'], face['name']) for face in new_faces],
+                'P'
+            )
+            for face in new_faces:
+                if face['student_id'] in marked and face['student_id'] not in marked_today:
                     marked_today.add(face['student_id'])
                     print(f"✅ Auto-marked: {face['name']}")
 
@@ -92,12 +175,10 @@ def generate_frames():
 
         # Encode frame
         ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        frame_bytes = buffer.tobytes()
-
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
 
-        time.sleep(0.03)  # ~30 FPS
+        # join() reads the encoded array through the buffer protocol - one copy
+        # instead of tobytes() plus two intermediate concatenations
+        yield b''.join((FRAME_PART_HEADER, buffer, b'\r\n'))
 
 @app.route('/')
 def index():
@@ -116,6 +197,7 @@ def start_camera():
     global is_camera_active
     get_camera()
     is_camera_active = True
+    start_capture()
     return jsonify({'success': True, 'message': 'Camera started'})
 
 @app.route('/api/stop_camera', methods=['POST'])
@@ -162,16 +244,20 @@ def capture_registration_image():
     """Capture image for registration"""
     global registration_images
 
-    data = request.json
-    image_data = data.get('image')
+    # The UI posts raw JPEG bytes; JSON with a base64 data URL is still accepted
+    if request.mimetype == 'image/jpeg':
+        image_data = request.get_data()
+    else:
+        image_data = request.json.get('image')
 
     if not image_data:
         return jsonify({'success': False, 'error': 'No image data'})
 
     try:
-        # Decode base64 image
-        image_bytes = base64.b64decode(image_data.split(',')[1])
-        nparr = np.frombuffer(image_bytes, np.uint8)
+        if isinstance(image_data, str):
+            # Decode base64 image
+            image_data = base64.b64decode(image_data.split(',')[1])
+        nparr = np.frombuffer(image_data, np.uint8)
         frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
         # Detect face and check quality
@@ -222,29 +308,28 @@ def complete_registration():
         student_id = registration_data['student_id']
         name = registration_data['name']
 
-        # Store in face system
-        face_system.encodings_db[student_id] = registration_images
-        face_system.student_metadata[student_id] = {
+        # Store in the face system and on disk, and add to the old database for
+        # compatibility - the two writes are independent, so overlap them
+        embeddings = np.stack(registration_images).astype(np.float32, copy=False)
+        gallery_write = io_pool.submit(face_system.store_student, student_id, embeddings, {
             'name': name,
             'email': registration_data.get('email'),
             'department': registration_data.get('department'),
             'year': registration_data.get('year'),
             'registered_at': datetime.now().isoformat(),
             'num_embeddings': len(registration_images)
-        }
-
-        # Save to disk
-        face_system._save_database()
-
-        # Also add to old database for compatibility
-        db_manager.add_student(
+        })
+        db_write = io_pool.submit(
+            db_manager.add_student,
             student_id,
             name,
             registration_data.get('email'),
             registration_data.get('department'),
             int(registration_data.get('year')) if registration_data.get('year') else None,
-            pickle.dumps(registration_images[0])  # Store first embedding
+            DatabaseManager.pack_embeddings(embeddings)
         )
+        gallery_write.result()
+        db_write.result()
 
         # Clear registration state
         registration_images = []
@@ -278,7 +363,8 @@ def delete_student(student_id):
     """Delete a student"""
     global marked_today
 
-    # Delete from production face recognition system
+    # Delete from production face recognition system first, so the stream stops
+    # matching the student before their attendance rows are removed
     success_face = face_system.delete_student(student_id)
 
     # Delete from database
@@ -305,7 +391,9 @@ def get_today_attendance():
     today = datetime.now().strftime('%Y-%m-%d')
     records = db_manager.get_attendance_by_date(today)
 
+    # Build the list and count present students in the same pass
     attendance_list = []
+    present = 0
     for record in records:
         attendance_list.append({
             'student_id': record[0],
@@ -313,9 +401,10 @@ def get_today_attendance():
             'time': record[2],
             'status': record[3]
         })
+        if record[3] == 'P':
+            present += 1
 
-    total_students = len(face_system.get_all_students())
-    present = len([r for r in records if r[3] == 'P'])
+    total_students = len(face_system.student_metadata)
     absent = total_students - present
 
     return jsonify({
@@ -374,25 +463,36 @@ def get_all_attendance():
         'total': len(attendance_list)
     })
 
+def write_attendance_excel(filepath, date, records):
+    """Stream attendance records into an Excel file one row at a time"""
+    # openpyxl is only needed for exports - import it on first use, not at startup
+    from openpyxl import Workbook
+
+    # Write-only workbooks keep memory flat instead of building the sheet in RAM
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+
+    sheet.append(['Student ID', 'Name', 'Date', 'Time', 'Status'])
+    for student_id, name, time, status in records:
+        sheet.append([student_id, name, date, time, status])
+
+    workbook.save(filepath)
+
 @app.route('/api/export/today', methods=['GET'])
 def export_today():
     """Export today's attendance to Excel"""
     today = datetime.now().strftime('%Y-%m-%d')
-    records = db_manager.get_attendance_by_date(today)
+    records = db_manager.iter_attendance_by_date(today)
+    first_record = next(records, None)
 
-    if not records:
+    if first_record is None:
         return jsonify({'success': False, 'error': 'No attendance records for today'})
 
-    # Create DataFrame
-    df = pd.DataFrame(records, columns=['Student ID', 'Name', 'Time', 'Status'])
-    df.insert(2, 'Date', today)
-
     # Save to Excel
-    os.makedirs('exports', exist_ok=True)
     filename = f"attendance_{today}.xlsx"
     filepath = os.path.join('exports', filename)
 
-    df.to_excel(filepath, index=False)
+    write_attendance_excel(filepath, today, chain([first_record], records))
 
     return send_file(filepath, as_attachment=True, download_name=filename)
 
@@ -400,21 +500,17 @@ def export_today():
 def export_by_date():
     """Export attendance by date to Excel"""
     date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
-    records = db_manager.get_attendance_by_date(date)
+    records = db_manager.iter_attendance_by_date(date)
+    first_record = next(records, None)
 
-    if not records:
+    if first_record is None:
         return jsonify({'success': False, 'error': f'No attendance records for {date}'})
 
-    # Create DataFrame
-    df = pd.DataFrame(records, columns=['Student ID', 'Name', 'Time', 'Status'])
-    df.insert(2, 'Date', date)
-
     # Save to Excel
-    os.makedirs('exports', exist_ok=True)
     filename = f"attendance_{date}.xlsx"
     filepath = os.path.join('exports', filename)
 
-    df.to_excel(filepath, index=False)
+    write_attendance_excel(filepath, date, chain([first_record], records))
 
     return send_file(filepath, as_attachment=True, download_name=filename)
 
@@ -450,12 +546,11 @@ def get_settings():
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get system statistics"""
-    students = face_system.get_all_students()
     today = datetime.now().strftime('%Y-%m-%d')
-    today_records = db_manager.get_attendance_by_date(today)
 
-    total_students = len(students)
-    present_today = len([r for r in today_records if r[3] == 'P'])
+    # Counted in SQLite - the stats poll only needs the number, not the rows
+    total_students = len(face_system.student_metadata)
+    present_today = db_manager.count_attendance_by_date(today, 'P')
 
     return jsonify({
         'total_students': total_students,
@@ -465,15 +560,21 @@ def get_stats():
         'camera_active': is_camera_active
     })
 
+BANNER_RULE = "=" * 70
+
 if __name__ == '__main__':
     port = 8000
-    print("\n" + "="*70)
-    print("🚀 FACE RECOGNITION ATTENDANCE SYSTEM - WEB SERVER")
-    print("="*70)
-    print(f"\n✅ System initialized with {len(face_system.encodings_db)} registered students")
-    print(f"✅ Server starting on http://localhost:{port}")
-    print(f"✅ Open your browser and navigate to: http://localhost:{port}")
-    print(f"\n💡 Press Ctrl+C to stop the server")
-    print("="*70 + "\n")
+    # Emit the banner in one write instead of one per line
+    print(
+        "\n" + BANNER_RULE + "\n"
+        "🚀 FACE RECOGNITION ATTENDANCE SYSTEM - WEB SERVER\n"
+        + BANNER_RULE + "\n"
+        f"\n✅ System initialized with {len(face_system.encodings_db)} registered students\n"
+        f"✅ Server starting on http://localhost:{port}\n"
+        f"✅ Open your browser and navigate to: http://localhost:{port}\n"
+        f"\n💡 Press Ctrl+C to stop the server\n"
+        + BANNER_RULE + "\n",
+        flush=True
+    )
 
     app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
@@ -1,128 +1,187 @@
 import sqlite3
 from datetime import datetime
 import os
+import struct
+import threading
+import numpy as np
+
+# face_encoding BLOB layout: '<II' header (count, dim) followed by count x dim float32
+EMBEDDING_HEADER = struct.Struct('<II')
 
 class DatabaseManager:
     def __init__(self, db_path='database/attendance.db'):
         self.db_path = db_path
+        # One shared connection keeps sqlite's prepared statement cache warm across
+        # calls; the lock serializes access from Flask's request threads
+        self.conn = self._connect()
+        self.lock = threading.Lock()
         self.create_tables()
     
+    def _connect(self):
+        """Open a connection tuned for frequent small writes"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # WAL only needs an fsync at checkpoints, not on every commit
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
     def create_tables(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS students (
-                student_id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                email TEXT,
-                department TEXT,
-                year INTEGER,
-                face_encoding BLOB
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS attendance (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                student_id TEXT,
-                name TEXT,
-                date TEXT,
-                time TEXT,
-                status TEXT,
-                FOREIGN KEY (student_id) REFERENCES students (student_id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with self.lock:
+            cursor = self.conn.cursor()
+            
+            # WAL is persistent - set once on the database file
+            cursor.execute('PRAGMA journal_mode=WAL')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS students (
+                    student_id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    email TEXT,
+                    department TEXT,
+                    year INTEGER,
+                    face_encoding BLOB
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS attendance (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    student_id TEXT,
+                    name TEXT,
+                    date TEXT,
+                    time TEXT,
+                    status TEXT,
+                    FOREIGN KEY (student_id) REFERENCES students (student_id)
+                )
+            ''')
+            
+            # Every attendance lookup filters on date (and usually student_id) -
+            # without this index each one scans the whole history
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_attendance_date_student
+                ON attendance (date, student_id)
+            ''')
+            
+            self.conn.commit()
     
+    @staticmethod
+    def pack_embeddings(embeddings):
+        """Pack a list or (count, dim) array of embeddings into a single contiguous BLOB"""
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        count, dim = matrix.shape
+        return EMBEDDING_HEADER.pack(count, dim) + matrix.tobytes()
+
     def add_student(self, student_id, name, email, department, year, face_encoding):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                INSERT INTO students (student_id, name, email, department, year, face_encoding)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (student_id, name, email, department, year, face_encoding))
-            conn.commit()
-            return True
-        except sqlite3.IntegrityError:
-            return False
-        finally:
-            conn.close()
+        """Insert a student, or update the row in the same statement when re-registering"""
+        with self.lock:
+            try:
+                self.conn.execute('''
+                    INSERT INTO students (student_id, name, email, department, year, face_encoding)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(student_id) DO UPDATE SET
+                        name = excluded.name,
+                        email = excluded.email,
+                        department = excluded.department,
+                        year = excluded.year,
+                        face_encoding = excluded.face_encoding
+                ''', (student_id, name, email, department, year, face_encoding))
+                self.conn.commit()
+                return True
+            except sqlite3.IntegrityError:
+                self.conn.rollback()
+                return False
     
     def mark_attendance(self, student_id, name, status='P'):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        date = datetime.now().strftime('%Y-%m-%d')
-        time = datetime.now().strftime('%H:%M:%S')
+        return bool(self.mark_attendance_many([(student_id, name)], status))
+    
+    def mark_attendance_many(self, students, status='P'):
+        """Mark (student_id, name) pairs with one insert-if-absent per student and one commit; returns newly marked IDs"""
+        # One clock read - two could straddle midnight and disagree on the day
+        now = datetime.now()
+        date = now.strftime('%Y-%m-%d')
+        time = now.strftime('%H:%M:%S')
         
-        cursor.execute('''
-            SELECT * FROM attendance 
-            WHERE student_id = ? AND date = ?
-        ''', (student_id, date))
+        names = dict(students)
+        if not names:
+            return []
         
-        if cursor.fetchone() is None:
-            cursor.execute('''
-                INSERT INTO attendance (student_id, name, date, time, status)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (student_id, name, date, time, status))
-            conn.commit()
-            conn.close()
-            return True
-        else:
-            conn.close()
-            return False
+        with self.lock:
+            cursor = self.conn.cursor()
+            marked = []
+            for student_id, name in names.items():
+                # Check and insert in one statement - no separate SELECT round trip and
+                # no window between the check and the write
+                cursor.execute('''
+                    INSERT INTO attendance (student_id, name, date, time, status)
+                    SELECT ?, ?, ?, ?, ?
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM attendance WHERE date = ? AND student_id = ?
+                    )
+                ''', (student_id, name, date, time, status, date, student_id))
+                if cursor.rowcount:
+                    marked.append(student_id)
+            self.conn.commit()
+            return marked
     
     def get_all_students(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT student_id, name, email, department, year, face_encoding FROM students')
-        students = cursor.fetchall()
-        conn.close()
-        return students
+        with self.lock:
+            return self.conn.execute(
+                'SELECT student_id, name, email, department, year, face_encoding FROM students'
+            ).fetchall()
     
     def get_attendance_by_date(self, date):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT student_id, name, time, status 
-            FROM attendance 
-            WHERE date = ?
-        ''', (date,))
-        records = cursor.fetchall()
-        conn.close()
-        return records
+        with self.lock:
+            return self.conn.execute('''
+                SELECT student_id, name, time, status 
+                FROM attendance 
+                WHERE date = ?
+            ''', (date,)).fetchall()
+    
+    def count_attendance_by_date(self, date, status='P'):
+        with self.lock:
+            return self.conn.execute('''
+                SELECT COUNT(*) FROM attendance 
+                WHERE date = ? AND status = ?
+            ''', (date, status)).fetchone()[0]
+    
+    def iter_attendance_by_date(self, date, batch_size=1024):
+        """Yield attendance records for a date without loading them all at once"""
+        # A separate connection used only for this read - WAL lets it read while the shared
+        # one writes, and the lock is not held for the duration of an export
+        conn = self._connect()
+        try:
+            cursor = conn.execute('''
+                SELECT student_id, name, time, status 
+                FROM attendance 
+                WHERE date = ?
+            ''', (date,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
     
     def get_all_attendance(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT student_id, name, date, time, status
-            FROM attendance
-            ORDER BY date DESC, time DESC
-        ''')
-        records = cursor.fetchall()
-        conn.close()
-        return records
+        with self.lock:
+            return self.conn.execute('''
+                SELECT student_id, name, date, time, status
+                FROM attendance
+                ORDER BY date DESC, time DESC
+            ''').fetchall()
 
     def delete_student(self, student_id):
         """Delete student and all their attendance records"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
-            # Delete attendance records first (foreign key constraint)
-            cursor.execute('DELETE FROM attendance WHERE student_id = ?', (student_id,))
-            # Delete student
-            cursor.execute('DELETE FROM students WHERE student_id = ?', (student_id,))
-            conn.commit()
-            return True
-        except Exception as e:
-            print(f"Error deleting student: {e}")
-            return False
-        finally:
-            conn.close()
\ No newline at end of file
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                # Delete attendance records first (foreign key constraint)
+                cursor.execute('DELETE FROM attendance WHERE student_id = ?', (student_id,))
+                # Delete student
+                cursor.execute('DELETE FROM students WHERE student_id = ?', (student_id,))
+                self.conn.commit()
+                return True
+            except Exception as e:
+                self.conn.rollback()
+                print(f"Error deleting student: {e}")
+                return False
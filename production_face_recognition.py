@@ -17,25 +17,46 @@ import os
 from datetime import datetime
 from collections import defaultdict
 import json
+import io
+import threading
+import time
 
 # Deep learning models
 from facenet_pytorch import MTCNN, InceptionResnetV1
 import torch
 from PIL import Image
 
-# Fallback to face_recognition if MTCNN fails
-import face_recognition
+# On-disk gallery precision. Unit-norm embeddings lose ~1e-3 cosine similarity in
+# float16 - far below the recognition threshold margin - and the file halves in size
+GALLERY_DTYPE = np.float16
+
+# FaceNet checkpoint as cached by facenet_pytorch (includes the unused classifier layer)
+FACENET_WEIGHTS = '20180402-114759-vggface2.pt'
+VGGFACE2_CLASSES = 8631
 
 class ProductionFaceRecognition:
-    def __init__(self, device='cpu'):
+    def __init__(self, device=None):
         """
         Initialize with state-of-the-art models
         Args:
-            device: 'cuda' for GPU or 'cpu' for CPU
+            device: 'cuda' for GPU, 'cpu' for CPU, or None to use CUDA when available
         """
         print("🚀 Initializing Production Face Recognition System...")
 
+        # Run detection and embedding on the GPU when one is present
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            # Without CUDA, FaceNet can still use the Metal GPU on Apple laptops. MTCNN
+            # stays on the CPU - its image pyramid uses resize ops MPS lacks
+            if device == 'cpu' and torch.backends.mps.is_available():
+                embedding_device = 'mps'
+            else:
+                embedding_device = device
+        else:
+            embedding_device = device
         self.device = torch.device(device)
+        self.embedding_device = torch.device(embedding_device)
+        print(f"🖥️  Using device: {self.device} (embeddings: {self.embedding_device})")
 
         # MTCNN for face detection (optimized for speed)
         self.mtcnn = MTCNN(
@@ -51,11 +72,17 @@ class ProductionFaceRecognition:
         )
 
         # FaceNet for face recognition (512D embeddings)
-        self.facenet = InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
+        self.facenet = self._load_facenet().eval().to(self.embedding_device)
 
         # Recognition database
         self.encodings_db = defaultdict(list)  # student_id -> list of embeddings
         self.student_metadata = {}  # student_id -> metadata
+        self._gallery_index = None  # Stacked encodings for matching, rebuilt on change
+        self._gallery_lock = threading.Lock()
+        # Serializes gallery changes with their disk writes - held from the in-memory
+        # update through _save_database/_append_to_database, which must run under it
+        self._persist_lock = threading.RLock()
+        self._students_cache = None  # get_all_students() result, built on demand
 
         # Configuration
         self.min_face_size = 60  # Minimum face dimensions
@@ -72,12 +99,41 @@ class ProductionFaceRecognition:
         # Anti-spoofing
         self.enable_spoofing_detection = True
 
-        # Cache
-        self.recognition_cache = {}
-        self.cache_duration = 3  # seconds
+        # Cache of recently recognized faces (bbox, match, timestamp, gallery index)
+        self.recognition_cache = []
+        self.cache_duration = 3  # seconds before a tracked face is re-verified
+
+        # Per-thread frame buffers (video stream and registration requests run concurrently)
+        self._frame_buffers = threading.local()
+
+        # Database directory is created once here rather than on every save
+        os.makedirs('database/production', exist_ok=True)
 
         print("✅ System initialized successfully!")
 
+    def _load_facenet(self) -> InceptionResnetV1:
+        """
+        Build FaceNet with its vggface2 weights, memory-mapping the checkpoint when
+        facenet_pytorch has already cached it instead of reading ~100MB onto the heap
+        """
+        torch_home = os.path.expanduser(os.getenv(
+            'TORCH_HOME', os.path.join(os.getenv('XDG_CACHE_HOME', '~/.cache'), 'torch')))
+        cached_file = os.path.join(torch_home, 'checkpoints', FACENET_WEIGHTS)
+
+        if os.path.exists(cached_file):
+            try:
+                state_dict = torch.load(cached_file, mmap=True, weights_only=True)
+                # Build on the meta device - the weights are assigned, so random init is wasted
+                with torch.device('meta'):
+                    model = InceptionResnetV1()
+                    model.logits = torch.nn.Linear(512, VGGFACE2_CLASSES)
+                model.load_state_dict(state_dict, assign=True)
+                return model
+            except (RuntimeError, pickle.UnpicklingError):
+                pass  # Legacy checkpoint format - let facenet_pytorch load it normally
+
+        return InceptionResnetV1(pretrained='vggface2')
+
     def detect_faces(self, image: np.ndarray) -> List[Dict]:
         """
         Detect faces using MTCNN with quality assessment
@@ -86,16 +142,21 @@ class ProductionFaceRecognition:
         # Scale down image for faster detection
         h, w = image.shape[:2]
         scaled_h, scaled_w = int(h * self.image_scale), int(w * self.image_scale)
-        scaled_image = cv2.resize(image, (scaled_w, scaled_h))
 
-        # Convert to PIL for MTCNN
-        if isinstance(scaled_image, np.ndarray):
-            image_pil = Image.fromarray(cv2.cvtColor(scaled_image, cv2.COLOR_BGR2RGB))
-        else:
-            image_pil = scaled_image
+        # Reuse this thread's scratch buffers instead of allocating two images per frame
+        buffers = self._frame_buffers
+        if getattr(buffers, 'scaled', None) is None or buffers.scaled.shape[:2] != (scaled_h, scaled_w):
+            buffers.scaled = np.empty((scaled_h, scaled_w, 3), dtype=np.uint8)
+            buffers.rgb = np.empty((scaled_h, scaled_w, 3), dtype=np.uint8)
+
+        # INTER_AREA averages pixels when shrinking - cleaner input for MTCNN at the same cost
+        cv2.resize(image, (scaled_w, scaled_h), dst=buffers.scaled, interpolation=cv2.INTER_AREA)
+
+        # MTCNN takes RGB arrays directly - no need to build a PIL image per frame
+        image_rgb = cv2.cvtColor(buffers.scaled, cv2.COLOR_BGR2RGB, dst=buffers.rgb)
 
         # Detect faces and get bounding boxes, probabilities, landmarks
-        boxes, probs, landmarks = self.mtcnn.detect(image_pil, landmarks=True)
+        boxes, probs, landmarks = self.mtcnn.detect(image_rgb, landmarks=True)
 
         detections = []
 
@@ -175,9 +236,14 @@ class ProductionFaceRecognition:
 
         if face_tensor is None:
             # Fallback: manual preprocessing
-            face_resized = cv2.resize(face_img, (160, 160))
-            face_rgb = cv2.cvtColor(face_resized, cv2.COLOR_BGR2RGB)
-            face_normalized = (face_rgb - 127.5) / 128.0
+            # Face crops are usually larger than 160px - INTER_AREA is the SIMD box filter
+            # made for shrinking; keep INTER_LINEAR when the crop has to be enlarged
+            h, w = face_img.shape[:2]
+            interpolation = cv2.INTER_AREA if h > 160 and w > 160 else cv2.INTER_LINEAR
+            face_resized = cv2.resize(face_img, (160, 160), interpolation=interpolation)
+            # Normalizing allocates a fresh array anyway - read it through a reversed
+            # channel view instead of running a separate BGR->RGB pass first
+            face_normalized = (face_resized[..., ::-1] - 127.5) / 128.0
             face_tensor = torch.FloatTensor(face_normalized).permute(2, 0, 1).unsqueeze(0)
         else:
             # Fix tensor dimensions - ensure [1, 3, 160, 160]
@@ -192,10 +258,10 @@ class ProductionFaceRecognition:
                 # This shouldn't happen, but handle it
                 raise ValueError(f"Unexpected 2D tensor from MTCNN: {face_tensor.shape}")
 
-        face_tensor = face_tensor.to(self.device)
+        face_tensor = face_tensor.to(self.embedding_device)
 
-        # Extract embedding
-        with torch.no_grad():
+        # Extract embedding - inference mode also skips autograd's version-counter bookkeeping
+        with torch.inference_mode():
             embedding = self.facenet(face_tensor).cpu().numpy().flatten()
 
         # Normalize embedding
@@ -203,6 +269,15 @@ class ProductionFaceRecognition:
 
         return embedding
 
+    def warmup(self, frame_size: Tuple[int, int] = (720, 1280)):
+        """
+        Run both models once on blank input so the first live frame doesn't pay
+        for CUDA/MPS context setup, kernel selection and allocator growth
+        """
+        self.detect_faces(np.zeros((*frame_size, 3), dtype=np.uint8))
+        with torch.inference_mode():
+            self.facenet(torch.zeros(1, 3, 160, 160, device=self.embedding_device))
+
     def register_student(self, student_id: str, name: str, email: str = None,
                         department: str = None, year: int = None,
                         camera_index: int = 0) -> Dict:
@@ -222,6 +297,8 @@ class ProductionFaceRecognition:
         cap = cv2.VideoCapture(camera_index)
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        # Keep a single frame queued so read() hands back the newest frame
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
 
         captured_embeddings = []
         captured_count = 0
@@ -314,19 +391,14 @@ class ProductionFaceRecognition:
         if len(captured_embeddings) < self.min_registration_images:
             return {'success': False, 'error': f'Need at least {self.min_registration_images} images'}
 
-        # Store embeddings
-        self.encodings_db[student_id] = captured_embeddings
-        self.student_metadata[student_id] = {
+        self.store_student(student_id, np.stack(captured_embeddings), {
             'name': name,
             'email': email,
             'department': department,
             'year': year,
             'registered_at': datetime.now().isoformat(),
             'num_embeddings': len(captured_embeddings)
-        }
-
-        # Save to disk
-        self._save_database()
+        })
 
         print(f"✅ Successfully registered with {len(captured_embeddings)} images")
         return {'success': True, 'student_id': student_id, 'num_images': len(captured_embeddings)}
@@ -344,6 +416,21 @@ class ProductionFaceRecognition:
         # Detect faces
         detections = self.detect_faces(frame)
 
+        # Drop tracks that are due for re-verification - monotonic, so a wall-clock
+        # adjustment can't expire every track at once or keep stale ones alive.
+        # Tracks matched against an older index are dropped too, so a deleted or
+        # re-registered student's identity is never reused
+        now = time.monotonic()
+        index = self._gallery_index
+        self.recognition_cache = [
+            track for track in self.recognition_cache
+            if now - track['timestamp'] < self.cache_duration and track['index'] is index
+        ]
+
+        # Tracks matched in this frame. A face that is no longer detected loses its
+        # track right away, so the next person stepping into the same spot is
+        # recognized afresh instead of inheriting the previous identity
+        active_tracks = []
         recognized_faces = []
 
         for detection in detections:
@@ -358,11 +445,33 @@ class ProductionFaceRecognition:
                 })
                 continue
 
-            # Extract embedding
-            embedding = self.extract_embedding(detection['face_image'])
+            # Reuse the identity of a recognized face that has barely moved
+            track = self._find_track(detection['bbox'])
 
-            # Match against database using ensemble voting
-            match = self._match_embedding(embedding)
+            if track is not None:
+                track['bbox'] = detection['bbox']
+                match = track['match']
+                active_tracks.append(track)
+            # Nothing to match against - skip the FaceNet forward pass entirely
+            elif not self.encodings_db:
+                match = None
+            else:
+                # Extract embedding
+                embedding = self.extract_embedding(detection['face_image'])
+
+                # Match against database using ensemble voting
+                match = self._match_embedding(embedding)
+
+                # Only known faces are cached, so an Unknown gets a fresh look every frame
+                # Tagged with the index taken before matching - if a refresh lands in
+                # between, the track is dropped next frame rather than kept stale
+                if match:
+                    active_tracks.append({
+                        'bbox': detection['bbox'],
+                        'match': match,
+                        'timestamp': now,
+                        'index': index
+                    })
 
             if match:
                 recognized_faces.append({
@@ -382,43 +491,112 @@ class ProductionFaceRecognition:
                     'quality': detection['quality']
                 })
 
+        self.recognition_cache = active_tracks
+
         return recognized_faces
 
+    def _find_track(self, bbox: Tuple[int, int, int, int], min_iou: float = 0.7) -> Optional[Dict]:
+        """
+        Find the cached track overlapping bbox the most (IoU above min_iou)
+        """
+        best_track = None
+        best_iou = min_iou
+
+        x1, y1, x2, y2 = bbox
+        area = (x2 - x1) * (y2 - y1)
+
+        for track in self.recognition_cache:
+            tx1, ty1, tx2, ty2 = track['bbox']
+            inter_w = min(x2, tx2) - max(x1, tx1)
+            inter_h = min(y2, ty2) - max(y1, ty1)
+            if inter_w <= 0 or inter_h <= 0:
+                continue
+
+            intersection = inter_w * inter_h
+            union = area + (tx2 - tx1) * (ty2 - ty1) - intersection
+            iou = intersection / union
+
+            if iou > best_iou:
+                best_iou = iou
+                best_track = track
+
+        return best_track
+
+    def _build_gallery_index(self) -> Optional[Dict]:
+        """
+        Stack all registered embeddings into one contiguous (M, 512) matrix
+        Row r belongs to student row_student[r] and is that student's row_slot[r]-th image
+        """
+        student_ids = [sid for sid, embeddings in self.encodings_db.items() if len(embeddings)]
+        if not student_ids:
+            return None
+
+        counts = np.array([len(self.encodings_db[sid]) for sid in student_ids])
+        starts = np.cumsum(counts) - counts
+
+        # Fill a preallocated C-contiguous matrix in place - the float16 memmap views are
+        # upcast straight into it instead of through per-student temporaries
+        matrix = np.empty((counts.sum(), 512), dtype=np.float32)
+        for sid, start, count in zip(student_ids, starts, counts):
+            matrix[start:start + count] = np.reshape(self.encodings_db[sid], (-1, 512))
+        row_student = np.repeat(np.arange(len(student_ids)), counts)
+        row_slot = np.arange(len(matrix)) - np.repeat(starts, counts)
+
+        return {
+            'student_ids': student_ids,
+            # Resolved here so a match is a list index, not a metadata dict lookup per frame
+            'metadata': [self.student_metadata.get(sid, {}) for sid in student_ids],
+            'matrix': matrix,
+            'counts': counts,
+            'row_student': row_student,
+            'row_slot': row_slot
+        }
+
+    def _refresh_gallery(self):
+        """Rebuild the matching index and drop the student list after the gallery changes"""
+        # Built on the caller's thread (registration, delete) and swapped in with a single
+        # assignment, so the video stream never stalls on a rebuild or sees a partial index
+        with self._gallery_lock:
+            self._gallery_index = self._build_gallery_index()
+            self._students_cache = None
+
     def _match_embedding(self, embedding: np.ndarray) -> Optional[Dict]:
         """
         Match embedding against database using ensemble voting
         Each registered student has multiple embeddings - we use voting
         """
-        if not self.encodings_db:
+        # Take one reference - a concurrent refresh replaces the index, never mutates it
+        index = self._gallery_index
+        if index is None:
             return None
 
-        best_match = None
-        best_confidence = 0
-
-        for student_id, registered_embeddings in self.encodings_db.items():
-            # Compute cosine similarities with all registered embeddings
-            similarities = []
-            for reg_embedding in registered_embeddings:
-                # Cosine similarity
-                similarity = np.dot(embedding, reg_embedding)
-                similarities.append(similarity)
-
-            # Ensemble voting: use top-k average
-            k = min(3, len(similarities))  # Top 3 or all if less
-            top_k_similarities = sorted(similarities, reverse=True)[:k]
-            avg_similarity = np.mean(top_k_similarities)
-
-            # Check if this is the best match
-            if avg_similarity > best_confidence and avg_similarity > self.recognition_threshold:
-                best_confidence = avg_similarity
-                best_match = {
-                    'student_id': student_id,
-                    'name': self.student_metadata[student_id]['name'],
-                    'confidence': float(avg_similarity),
-                    'metadata': self.student_metadata[student_id]
-                }
-
-        return best_match
+        # Cosine similarity against every registered embedding in one matrix-vector product
+        similarities = index['matrix'] @ embedding.astype(np.float32, copy=False)
+
+        # Scatter into a (students, max images) table, padding with -inf
+        table = np.full((len(index['counts']), index['counts'].max()), -np.inf, dtype=np.float32)
+        table[index['row_student'], index['row_slot']] = similarities
+
+        # Ensemble voting: use top-k average (top 3 or all if less)
+        k = np.minimum(3, index['counts'])
+        top = -np.sort(-table, axis=1)[:, :3]
+        top = np.where(np.arange(top.shape[1]) < k[:, None], top, 0.0)
+        avg_similarity = top.sum(axis=1) / k
+
+        best = int(np.argmax(avg_similarity))
+        best_confidence = avg_similarity[best]
+
+        if best_confidence <= 0 or best_confidence <= self.recognition_threshold:
+            return None
+
+        student_id = index['student_ids'][best]
+        metadata = index['metadata'][best]
+        return {
+            'student_id': student_id,
+            'name': metadata.get('name', student_id),
+            'confidence': float(best_confidence),
+            'metadata': metadata
+        }
 
     def draw_results(self, frame: np.ndarray, recognized_faces: List[Dict]) -> np.ndarray:
         """
@@ -459,59 +637,206 @@ class ProductionFaceRecognition:
 
         return frame
 
+    def store_student(self, student_id: str, embeddings: np.ndarray, metadata: Dict):
+        """
+        Add or replace a student's embeddings and metadata, then save them to disk
+        """
+        with self._persist_lock:
+            # Store embeddings as one contiguous (n, 512) block
+            self.encodings_db[student_id] = np.asarray(embeddings, dtype=np.float32).reshape(-1, 512)
+            self.student_metadata[student_id] = metadata
+            self._refresh_gallery()
+
+            # Save to disk (appends only the new student's embeddings)
+            self._append_to_database(student_id)
+
     def _save_database(self):
         """Save encodings and metadata to disk"""
-        os.makedirs('database/production', exist_ok=True)
+        # Save encodings as a single (N, 512) matrix plus the student_id of each row
+        ids = []
+        for student_id, embeddings in self.encodings_db.items():
+            ids.extend([student_id] * len(embeddings))
+
+        if ids:
+            gallery = np.concatenate([
+                np.asarray(embeddings, dtype=GALLERY_DTYPE).reshape(-1, 512)
+                for embeddings in self.encodings_db.values()
+            ])
+        else:
+            gallery = np.empty((0, 512), dtype=GALLERY_DTYPE)
 
-        # Save encodings
-        with open('database/production/encodings.pkl', 'wb') as f:
-            pickle.dump(dict(self.encodings_db), f)
+        # Every full save writes a new gallery file, and ids.json - which names the file
+        # its ids belong to - is swapped in last, so rows and ids are committed together
+        gallery_file = f'embeddings-{time.time_ns()}.npy'
+        np.save(os.path.join('database/production', gallery_file), gallery)
+        self._write_json('database/production/ids.json', {'embeddings': gallery_file, 'ids': ids})
 
         # Save metadata
-        with open('database/production/metadata.json', 'w') as f:
-            json.dump(self.student_metadata, f, indent=2)
+        self._write_json('database/production/metadata.json', self.student_metadata, indent=2)
+
+        # Drop superseded gallery files. Removing one that is still mapped fails on
+        # Windows - it is left for the next save
+        for name in os.listdir('database/production'):
+            if name.startswith('embeddings') and name.endswith('.npy') and name != gallery_file:
+                try:
+                    os.remove(os.path.join('database/production', name))
+                except OSError:
+                    pass
+
+        print("💾 Database saved")
+
+    @staticmethod
+    def _write_json(path: str, data, **kwargs):
+        """Write JSON to a temp file and swap it in, so readers never see a partial file"""
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(data, f, **kwargs)
+        os.replace(f'{path}.tmp', path)
+
+    def _read_gallery_manifest(self) -> Optional[Tuple[str, List[str]]]:
+        """Return (gallery file, student_id of each row) from ids.json, or None if unsaved"""
+        if not os.path.exists('database/production/ids.json'):
+            return None
+
+        with open('database/production/ids.json', 'r') as f:
+            manifest = json.load(f)
+        return os.path.join('database/production', manifest['embeddings']), manifest['ids']
+
+    def _append_to_database(self, student_id: str):
+        """
+        Append one newly registered student to the saved gallery
+        Only the new rows are written; falls back to a full save when that is not possible
+        """
+        manifest = self._read_gallery_manifest()
+        if manifest is None or not os.path.exists(manifest[0]):
+            self._save_database()
+            return
+
+        path, ids = manifest
+
+        # Re-registration replaces existing rows, which needs a full rewrite
+        if student_id in ids:
+            self._save_database()
+            return
+
+        new_rows = np.asarray(self.encodings_db[student_id]).reshape(-1, 512)
+
+        appended = False
+        with open(path, 'r+b') as f:
+            if np.lib.format.read_magic(f) == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                data_offset = f.tell()
+
+                # The header is padded, so the larger row count normally fits in place
+                header = io.BytesIO()
+                np.lib.format.write_array_header_1_0(header, {
+                    'descr': np.lib.format.dtype_to_descr(dtype),
+                    'fortran_order': False,
+                    'shape': (shape[0] + len(new_rows), shape[1])
+                })
+                header = header.getvalue()
+
+                # Rows past the ids (an interrupted append) would end up under the wrong
+                # student, so only append to a file whose rows match ids.json exactly
+                if (not fortran_order and dtype.kind == 'f' and len(header) == data_offset
+                        and shape[0] == len(ids)):
+                    # Data first, then the header - a crash never leaves the header
+                    # claiming rows that were not written. Rows take the file's dtype,
+                    # so galleries saved before the float16 switch keep working
+                    f.seek(0, os.SEEK_END)
+                    f.write(new_rows.astype(dtype).tobytes())
+                    f.flush()
+                    f.seek(0)
+                    f.write(header)
+                    appended = True
+
+        if not appended:
+            self._save_database()
+            return
+
+        # The rows are in place - committing the ids makes them visible
+        ids.extend([student_id] * len(new_rows))
+        self._write_json('database/production/ids.json',
+                         {'embeddings': os.path.basename(path), 'ids': ids})
+
+        self._write_json('database/production/metadata.json', self.student_metadata, indent=2)
 
         print("💾 Database saved")
 
     def load_database(self):
         """Load encodings and metadata from disk"""
         try:
-            if os.path.exists('database/production/encodings.pkl'):
-                with open('database/production/encodings.pkl', 'rb') as f:
-                    self.encodings_db = defaultdict(list, pickle.load(f))
-
-            if os.path.exists('database/production/metadata.json'):
-                with open('database/production/metadata.json', 'r') as f:
-                    self.student_metadata = json.load(f)
-
-            print(f"✅ Loaded {len(self.encodings_db)} students from database")
-            return True
+            with self._persist_lock:
+                if os.path.exists('database/production/metadata.json'):
+                    with open('database/production/metadata.json', 'r') as f:
+                        self.student_metadata = json.load(f)
+
+                manifest = self._read_gallery_manifest()
+                if manifest is not None:
+                    # Memory-map the gallery so the OS page cache serves repeated launches
+                    path, ids = manifest
+                    gallery = np.load(path, mmap_mode='r')
+
+                    # Extra rows are left by an interrupted append and are not committed yet.
+                    # Fewer rows than ids means the files don't belong together - refuse
+                    # rather than hand students each other's embeddings
+                    if len(ids) > len(gallery):
+                        raise ValueError(f"{path} has {len(gallery)} rows but ids.json lists {len(ids)}")
+                    gallery = gallery[:len(ids)]
+
+                    # Rows of a student are contiguous, so each entry is a view into the map.
+                    # Run boundaries are found in one vectorized pass over the row ids
+                    self.encodings_db = defaultdict(list)
+                    if ids:
+                        ids = np.asarray(ids)
+                        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+                        ends = np.r_[starts[1:], len(ids)]
+                        for start, end in zip(starts, ends):
+                            self.encodings_db[str(ids[start])] = gallery[start:end]
+
+                elif os.path.exists('database/production/encodings.pkl'):
+                    # Legacy pickle database - migrate it to the mapped format
+                    with open('database/production/encodings.pkl', 'rb') as f:
+                        self.encodings_db = defaultdict(list, pickle.load(f))
+                    self._save_database()
+
+                self._refresh_gallery()
+                print(f"✅ Loaded {len(self.encodings_db)} students from database")
+                return True
         except Exception as e:
             print(f"❌ Error loading database: {e}")
             return False
 
     def get_all_students(self) -> List[Dict]:
-        """Get list of all registered students"""
-        students = []
-        for student_id, metadata in self.student_metadata.items():
-            students.append({
-                'student_id': student_id,
-                **metadata
-            })
+        """Get list of all registered students (cached until the gallery changes)"""
+        # Built and stored under the lock _refresh_gallery clears it with, so a list
+        # built from metadata that changed meanwhile is always discarded
+        with self._gallery_lock:
+            students = self._students_cache
+            if students is None:
+                students = []
+                # list() snapshots the items in one step, safe against a concurrent insert
+                for student_id, metadata in list(self.student_metadata.items()):
+                    students.append({
+                        'student_id': student_id,
+                        **metadata
+                    })
+                self._students_cache = students
         return students
 
     def delete_student(self, student_id: str) -> bool:
         """Delete a student from the database"""
         try:
-            if student_id in self.encodings_db:
-                del self.encodings_db[student_id]
-            if student_id in self.student_metadata:
-                del self.student_metadata[student_id]
-
-            # Save updated database
-            self._save_database()
-            print(f"✅ Deleted student: {student_id}")
-            return True
+            with self._persist_lock:
+                if student_id in self.encodings_db:
+                    del self.encodings_db[student_id]
+                if student_id in self.student_metadata:
+                    del self.student_metadata[student_id]
+                self._refresh_gallery()
+
+                # Save updated database
+                self._save_database()
+                print(f"✅ Deleted student: {student_id}")
+                return True
         except Exception as e:
             print(f"❌ Error deleting student: {e}")
             return False